@@ -1,18 +1,29 @@
 import os
-import uuid
 import secrets
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
 from functools import wraps
-from flask import Flask, render_template, redirect, url_for, flash, request, send_from_directory, jsonify, session
+from flask import Flask, render_template, redirect, url_for, flash, request, send_from_directory, jsonify, session, abort, make_response
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import exists, and_, update
+from sqlalchemy.orm import joinedload
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash, safe_join
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
+from flask_caching import Cache
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from flask_wtf.csrf import validate_csrf
+from wtforms.validators import ValidationError
+from streaming_form_data import StreamingFormDataParser
+from streaming_form_data.targets import FileTarget, ValueTarget
 from dotenv import load_dotenv
-from PIL import Image
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from PIL import Image, ImageOps
 from whitenoise import WhiteNoise
 
 from forms import RegisterForm, LoginForm, BookingForm, PaymentForm, ProfileForm
@@ -23,6 +34,8 @@ load_dotenv()
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+ALLOWED_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF')
+UPLOAD_CHUNK_SIZE = 64 * 1024
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 app = Flask(__name__)
@@ -41,45 +54,186 @@ app.config['SESSION_COOKIE_SECURE'] = os.getenv('SESSION_COOKIE_SECURE', 'False'
 app.config['SESSION_COOKIE_HTTPONLY'] = os.getenv('SESSION_COOKIE_HTTPONLY', 'True').lower() == 'true'
 app.config['SESSION_COOKIE_SAMESITE'] = os.getenv('SESSION_COOKIE_SAMESITE', 'Lax')
 app.config['PERMANENT_SESSION_LIFETIME'] = int(os.getenv('PERMANENT_SESSION_LIFETIME', 3600))
+app.config['CACHE_TYPE'] = os.getenv('CACHE_TYPE', 'SimpleCache')
+app.config['CACHE_REDIS_URL'] = os.getenv('REDIS_URL')
+app.config['CACHE_DEFAULT_TIMEOUT'] = int(os.getenv('CACHE_DEFAULT_TIMEOUT', 300))
+
+# Connection pooling (SQLite fallback keeps SQLAlchemy's defaults)
+if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_pre_ping': True,
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    }
 
 db.init_app(app)
+cache = Cache(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
-# Initialize Whitenoise for static files
-app.wsgi_app = WhiteNoise(app.wsgi_app, root='static/')
-app.wsgi_app.add_files('static/img/', prefix='img/')
-app.wsgi_app.add_files('static/css/', prefix='css/')
+# Initialize Whitenoise for static files (set USE_WHITENOISE=0 when nginx serves /static/)
+if os.getenv('USE_WHITENOISE', '1') == '1':
+    app.wsgi_app = WhiteNoise(
+        app.wsgi_app,
+        root=os.path.join(BASE_DIR, 'static'),
+        prefix='static/',
+        autorefresh=os.getenv('FLASK_DEBUG', 'False').lower() == 'true',
+        max_age=int(os.getenv('STATIC_MAX_AGE', 3600))
+    )
 login_manager.session_protection = "strong"
 
+# Shared Redis storage keeps limits consistent across gunicorn workers
+if os.getenv('FLASK_ENV') == 'development':
+    RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI', 'memory://')
+else:
+    RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI', 'redis://localhost:6379/1')
+
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://"
+    storage_uri=RATELIMIT_STORAGE_URI,
+    strategy="moving-window",
+    in_memory_fallback_enabled=True
 )
 
+password_hasher = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=2)
+
+# Hashing already releases the GIL; this pool only caps how many 64 MiB Argon2
+# hashes a worker runs at once (HASH_WORKERS, defaulting to the CPU count)
+hash_executor = ThreadPoolExecutor(max_workers=int(os.getenv('HASH_WORKERS', os.cpu_count() or 1)))
+
+def hash_password(password):
+    """Hash a new password with Argon2 on the hashing pool"""
+    return hash_executor.submit(password_hasher.hash, password).result()
+
+def _check_password_hash(password_hash, password):
+    """Return (valid, new_hash), re-hashing legacy or outdated hashes on success"""
+    if password_hash.startswith('$argon2'):
+        try:
+            password_hasher.verify(password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False, None
+        if password_hasher.check_needs_rehash(password_hash):
+            return True, password_hasher.hash(password)
+        return True, None
+    if check_password_hash(password_hash, password):
+        return True, password_hasher.hash(password)
+    return False, None
+
+def verify_password(user, password):
+    """Check a password, upgrading legacy Werkzeug hashes to Argon2 on success"""
+    valid, new_hash = hash_executor.submit(_check_password_hash, user.password_hash, password).result()
+    if new_hash:
+        user.password_hash = new_hash
+    return valid
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@cache.memoize()
+def get_trains():
+    """Return train details for display, ordered by departure"""
+    return [
+        dict(id=t.id, name=t.name, number=t.number, from_station=t.from_station, to_station=t.to_station,
+             depart=t.depart, arrive=t.arrive, duration=t.duration, fare=t.fare)
+        for t in Train.query.order_by(Train.depart).all()
+    ]
+
+@cache.memoize()
+def get_train_choices():
+    """Return (id, label) pairs for the booking form's train selector"""
+    return [tuple(row) for row in db.session.query(Train.id, Train.display_label).order_by(Train.depart).all()]
+
+def clear_train_cache():
+    """Drop cached train data after trains are added or changed"""
+    cache.delete_memoized(get_trains)
+    cache.delete_memoized(get_train_choices)
+
+cleanup_queue = queue.Queue()
+
+def _cleanup_worker():
+    """Delete queued upload files in the background"""
+    while True:
+        path = cleanup_queue.get()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        finally:
+            cleanup_queue.task_done()
+
+threading.Thread(target=_cleanup_worker, name='upload-cleanup', daemon=True).start()
+
+def remove_upload(filename):
+    """Queue an uploaded file for deletion off the request thread"""
+    cleanup_queue.put(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+
+def get_user_bookings():
+    """Return the current user's bookings with their trains loaded in one query"""
+    return (Booking.query.options(joinedload(Booking.train))
+            .filter_by(user_id=current_user.id)
+            .order_by(Booking.booked_at.desc())
+            .all())
+
 def validate_image(file):
     """Validate and optimize uploaded image"""
     try:
-        img = Image.open(file)
+        img = Image.open(file, formats=ALLOWED_IMAGE_FORMATS)
         img.verify()
         file.seek(0)
         return True
     except Exception:
         return False
 
+def save_profile_image(file, original_filename):
+    """Store an optimized profile picture for the current user and return the one it replaced"""
+    # Secure filename
+    filename = secure_filename(original_filename)
+    ext = os.path.splitext(filename)[1].lower()
+    filename = f"user_{current_user.id}_{secrets.token_hex(12)}{ext}"
+    path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+
+    # Save and optimize image
+    file.seek(0)
+    img = Image.open(file, formats=ALLOWED_IMAGE_FORMATS)
+    # Let the JPEG decoder downscale via DCT instead of decoding full resolution
+    if img.format == 'JPEG':
+        img.draft('RGB', (1600, 1600))
+    img.load()
+    ImageOps.exif_transpose(img, in_place=True)
+    # Convert to RGB if necessary, only compositing onto white when there is an alpha channel
+    if img.mode == 'P':
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    if img.mode in ('RGBA', 'LA'):
+        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+        rgb_img.paste(img, mask=img.getchannel('A'))
+        img = rgb_img
+    elif img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+
+    # Resize if too large (max 800x800)
+    img.thumbnail((800, 800), Image.Resampling.LANCZOS)
+    img.save(path, 'JPEG', quality=85, optimize=True)
+
+    # Return the previous picture so the caller can remove it once the change is committed
+    old_filename = current_user.profile_pic
+    current_user.profile_pic = filename
+    return old_filename
+
+_SECURITY_HEADERS = (
+    ('X-Content-Type-Options', 'nosniff'),
+    ('X-Frame-Options', 'SAMEORIGIN'),
+    ('X-XSS-Protection', '1; mode=block'),
+    ('Strict-Transport-Security', 'max-age=31536000; includeSubDomains'),
+    ('Content-Security-Policy', "default-src 'self'; img-src 'self' data:; style-src 'self' 'unsafe-inline'; script-src 'self' 'unsafe-inline';"),
+)
+
 @app.after_request
 def set_security_headers(response):
     """Add security headers to all responses"""
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    response.headers['X-Frame-Options'] = 'SAMEORIGIN'
-    response.headers['X-XSS-Protection'] = '1; mode=block'
-    response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
-    response.headers['Content-Security-Policy'] = "default-src 'self'; img-src 'self' data:; style-src 'self' 'unsafe-inline'; script-src 'self' 'unsafe-inline';"
+    response.headers.update(_SECURITY_HEADERS)
     return response
 
 @login_manager.user_loader
@@ -89,17 +243,27 @@ def load_user(user_id):
     except (ValueError, TypeError):
         return None
 
-@app.before_request
-def create_tables_and_seed():
-    db.create_all()
-    if Train.query.count() == 0:
-        sample = [
-            Train(name='Blue Express', number='BE123', from_station='City A', to_station='City B', depart='08:00', arrive='12:30', duration='4h 30m', fare=450.0),
-            Train(name='Coastal Mail', number='CM456', from_station='City A', to_station='City C', depart='09:45', arrive='15:00', duration='5h 15m', fare=650.0),
-            Train(name='Sunrise Special', number='SS789', from_station='City B', to_station='City C', depart='16:00', arrive='19:30', duration='3h 30m', fare=520.0),
-        ]
-        db.session.add_all(sample)
-        db.session.commit()
+def init_db(app):
+    """Create tables and seed sample trains (runs once at startup, not per request)"""
+    with app.app_context():
+        db.create_all()
+        if Train.query.count() == 0:
+            sample = [
+                dict(name='Blue Express', number='BE123', from_station='City A', to_station='City B', depart='08:00', arrive='12:30', duration='4h 30m', fare=450.0),
+                dict(name='Coastal Mail', number='CM456', from_station='City A', to_station='City C', depart='09:45', arrive='15:00', duration='5h 15m', fare=650.0),
+                dict(name='Sunrise Special', number='SS789', from_station='City B', to_station='City C', depart='16:00', arrive='19:30', duration='3h 30m', fare=520.0),
+            ]
+            db.session.bulk_insert_mappings(Train, sample)
+            db.session.commit()
+            clear_train_cache()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create database tables and seed sample data"""
+    init_db(app)
+    print('Database initialized.')
+
+init_db(app)
 
 @app.errorhandler(RequestEntityTooLarge)
 def handle_file_too_large(e):
@@ -126,8 +290,9 @@ def register():
         return redirect(url_for('index'))
     form = RegisterForm()
     if form.validate_on_submit():
-        # Check for existing email (case-insensitive)
-        existing_user = User.query.filter(User.email.ilike(form.email.data.strip())).first()
+        # Emails are stored lower-cased, so an exact match hits the email index
+        email_norm = form.email.data.strip().lower()
+        existing_user = User.query.filter_by(email=email_norm).first()
         if existing_user:
             flash('Email already registered', 'danger')
             return render_template('auth/register.html', form=form)
@@ -135,8 +300,8 @@ def register():
         try:
             user = User(
                 name=form.name.data.strip(),
-                email=form.email.data.strip().lower(),
-                password_hash=generate_password_hash(form.password.data)
+                email=email_norm,
+                password_hash=hash_password(form.password.data)
             )
             db.session.add(user)
             db.session.commit()
@@ -155,8 +320,10 @@ def login():
         return redirect(url_for('index'))
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter(User.email.ilike(form.email.data.strip())).first()
-        if user and check_password_hash(user.password_hash, form.password.data):
+        email_norm = form.email.data.strip().lower()
+        user = User.query.filter_by(email=email_norm).first()
+        if user and verify_password(user, form.password.data):
+            db.session.commit()
             login_user(user, remember=True)
             flash('Logged in successfully', 'success')
             next_page = request.args.get('next')
@@ -174,12 +341,14 @@ def logout():
 @login_required
 @limiter.limit("10 per minute")
 def booking():
-    trains = Train.query.order_by(Train.depart).all()
+    trains = get_trains()
     if not trains:
         flash('No trains available at the moment.', 'warning')
+        if request.method == 'GET':
+            return redirect(url_for('index'))
     
     form = BookingForm()
-    form.train_id.choices = [(t.id, f"{t.name} • {t.number} • {t.from_station} → {t.to_station} • {t.depart}") for t in trains] if trains else []
+    form.train_id.choices = get_train_choices()
     
     if form.validate_on_submit():
         # Validate train exists
@@ -194,14 +363,15 @@ def booking():
             return render_template('booking.html', trains=trains, form=form)
         
         # Check for duplicate booking (same train, date, and passenger)
-        existing_booking = Booking.query.filter_by(
-            user_id=current_user.id,
-            train_id=train.id,
-            travel_date=form.travel_date.data,
-            passenger_name=form.passenger_name.data.strip()
-        ).first()
+        already_paid = db.session.query(exists().where(and_(
+            Booking.user_id == current_user.id,
+            Booking.train_id == train.id,
+            Booking.travel_date == form.travel_date.data,
+            Booking.passenger_name == form.passenger_name.data.strip(),
+            Booking.paid == True
+        ))).scalar()
         
-        if existing_booking and existing_booking.paid:
+        if already_paid:
             flash('You already have a paid booking for this train on this date', 'warning')
             return render_template('booking.html', trains=trains, form=form)
         
@@ -231,12 +401,10 @@ def booking():
 @login_required
 @limiter.limit("5 per minute")
 def payment(booking_id):
-    booking = Booking.query.get_or_404(booking_id)
-    
-    # Authorization check
-    if booking.user_id != current_user.id:
-        flash('Unauthorized access', 'danger')
-        return redirect(url_for('index'))
+    # Scoping the lookup to the current user doubles as the authorization check
+    booking = Booking.query.options(joinedload(Booking.train)).filter_by(
+        id=booking_id, user_id=current_user.id
+    ).first_or_404()
     
     # Check if already paid
     if booking.paid:
@@ -247,12 +415,15 @@ def payment(booking_id):
     if form.validate_on_submit():
         try:
             # In production, integrate with actual payment gateway here
-            booking.paid = True
-            booking.transaction_id = str(uuid.uuid4())
-            booking.paid_at = datetime.utcnow()
+            db.session.execute(
+                update(Booking)
+                .where(Booking.id == booking_id, Booking.paid == False)
+                .values(paid=True, transaction_id=secrets.token_hex(16), paid_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
             db.session.commit()
             flash('Payment successful! Your ticket has been confirmed.', 'success')
-            return redirect(url_for('ticket', booking_id=booking.id))
+            return redirect(url_for('ticket', booking_id=booking_id))
         except Exception as e:
             db.session.rollback()
             flash('Payment processing failed. Please try again.', 'danger')
@@ -263,57 +434,12 @@ def payment(booking_id):
 @login_required
 @limiter.limit("10 per minute")
 def profile():
-    form = ProfileForm(obj=current_user)
+    # Submitted data takes precedence, so only prefill from the user on GET
+    form = ProfileForm() if request.method == 'POST' else ProfileForm(obj=current_user)
     if form.validate_on_submit():
         try:
+            # Profile pictures are uploaded separately through profile_upload()
             current_user.name = form.name.data.strip()
-            file = form.profile_pic.data
-            
-            if file and file.filename:
-                # Validate file
-                if not allowed_file(file.filename):
-                    flash('Invalid file type. Only images (PNG, JPG, JPEG, GIF) are allowed.', 'danger')
-                    bookings = Booking.query.filter_by(user_id=current_user.id).order_by(Booking.booked_at.desc()).all()
-                    return render_template('profile.html', form=form, bookings=bookings)
-                
-                # Validate image
-                if not validate_image(file):
-                    flash('Invalid image file. Please upload a valid image.', 'danger')
-                    bookings = Booking.query.filter_by(user_id=current_user.id).order_by(Booking.booked_at.desc()).all()
-                    return render_template('profile.html', form=form, bookings=bookings)
-                
-                # Secure filename
-                filename = secure_filename(file.filename)
-                ext = os.path.splitext(filename)[1].lower()
-                filename = f"user_{current_user.id}_{uuid.uuid4().hex}{ext}"
-                path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                
-                # Save and optimize image
-                file.seek(0)
-                img = Image.open(file)
-                # Convert to RGB if necessary
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                    img = rgb_img
-                
-                # Resize if too large (max 800x800)
-                img.thumbnail((800, 800), Image.Resampling.LANCZOS)
-                img.save(path, 'JPEG', quality=85, optimize=True)
-                
-                # Delete old profile picture if exists
-                if current_user.profile_pic:
-                    old_path = os.path.join(app.config['UPLOAD_FOLDER'], current_user.profile_pic)
-                    if os.path.exists(old_path):
-                        try:
-                            os.remove(old_path)
-                        except Exception:
-                            pass
-                
-                current_user.profile_pic = filename
-            
             db.session.commit()
             flash('Profile updated successfully', 'success')
             return redirect(url_for('profile'))
@@ -321,20 +447,95 @@ def profile():
             db.session.rollback()
             flash('An error occurred while updating profile. Please try again.', 'danger')
     
-    bookings = Booking.query.filter_by(user_id=current_user.id).order_by(Booking.booked_at.desc()).all()
+    bookings = get_user_bookings()
     return render_template('profile.html', form=form, bookings=bookings)
 
+@app.route('/profile/upload', methods=['POST'])
+@login_required
+@limiter.limit("10 per minute")
+def profile_upload():
+    """Stream a profile picture straight to disk, bypassing werkzeug's form parser"""
+    if request.mimetype != 'multipart/form-data':
+        flash('Please choose an image to upload.', 'warning')
+        return redirect(url_for('profile'))
+
+    tmp_path = os.path.join(app.config['UPLOAD_FOLDER'], f".upload_{current_user.id}_{secrets.token_hex(12)}")
+    csrf_token = ValueTarget()
+    upload = FileTarget(tmp_path)
+    parser = StreamingFormDataParser(headers=request.headers)
+    parser.register('csrf_token', csrf_token)
+    parser.register('profile_pic', upload)
+
+    try:
+        max_size = app.config['MAX_CONTENT_LENGTH']
+        received = 0
+        while True:
+            chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            received += len(chunk)
+            if max_size and received > max_size:
+                raise RequestEntityTooLarge()
+            parser.data_received(chunk)
+
+        if app.config.get('WTF_CSRF_ENABLED', True):
+            try:
+                validate_csrf(csrf_token.value.decode())
+            except ValidationError:
+                flash('Your session has expired. Please try again.', 'danger')
+                return redirect(url_for('profile'))
+
+        if not upload.multipart_filename:
+            flash('Please choose an image to upload.', 'warning')
+            return redirect(url_for('profile'))
+
+        # Validate file
+        if not allowed_file(upload.multipart_filename):
+            flash('Invalid file type. Only images (PNG, JPG, JPEG, GIF) are allowed.', 'danger')
+            return redirect(url_for('profile'))
+
+        with open(tmp_path, 'rb') as file:
+            # Validate image
+            if not validate_image(file):
+                flash('Invalid image file. Please upload a valid image.', 'danger')
+                return redirect(url_for('profile'))
+            old_pic = save_profile_image(file, upload.multipart_filename)
+
+        db.session.commit()
+        if old_pic:
+            remove_upload(old_pic)
+        flash('Profile picture updated successfully', 'success')
+    except RequestEntityTooLarge:
+        raise
+    except Exception:
+        db.session.rollback()
+        flash('An error occurred while updating profile. Please try again.', 'danger')
+    finally:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+    return redirect(url_for('profile'))
+
 @app.route('/ticket/<int:booking_id>')
 @login_required
 def ticket(booking_id):
-    booking = Booking.query.get_or_404(booking_id)
-    if booking.user_id != current_user.id:
-        flash('Unauthorized', 'danger')
-        return redirect(url_for('index'))
+    booking = Booking.query.options(joinedload(Booking.train), joinedload(Booking.user)).filter_by(
+        id=booking_id, user_id=current_user.id
+    ).first_or_404()
     return render_template('ticket.html', booking=booking)
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
+    # Hand the file off to nginx when it fronts the app (e.g. UPLOADS_ACCEL_PREFIX=/protected-uploads/)
+    accel_prefix = os.getenv('UPLOADS_ACCEL_PREFIX')
+    if accel_prefix:
+        if not safe_join(app.config['UPLOAD_FOLDER'], filename):
+            abort(404)
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + filename
+        del response.headers['Content-Type']
+        return response
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
 if __name__ == '__main__':
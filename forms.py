@@ -5,11 +5,17 @@ from flask_wtf.file import FileAllowed, FileSize
 from datetime import date
 import re
 
+NAME_RE = re.compile(r'^[a-zA-Z\s]+$')
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+PASSWORD_RE = re.compile(r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)')
+EXPIRY_RE = re.compile(r'^(0[1-9]|1[0-2])\/\d{2}$')
+DIGITS_RE = re.compile(r'^\d+$')
+
 class RegisterForm(FlaskForm):
     name = StringField('Full Name', validators=[
         DataRequired(message='Name is required'),
         Length(min=2, max=120, message='Name must be between 2 and 120 characters'),
-        Regexp(r'^[a-zA-Z\s]+$', message='Name can only contain letters and spaces')
+        Regexp(NAME_RE, message='Name can only contain letters and spaces')
     ])
     email = StringField('Email Address', validators=[
         DataRequired(message='Email is required'),
@@ -19,7 +25,7 @@ class RegisterForm(FlaskForm):
     password = PasswordField('Password', validators=[
         DataRequired(message='Password is required'),
         Length(min=8, max=128, message='Password must be between 8 and 128 characters'),
-        Regexp(r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)', 
+        Regexp(PASSWORD_RE,
                message='Password must contain at least one uppercase letter, one lowercase letter, and one number')
     ])
     submit = SubmitField('Create Account')
@@ -30,8 +36,7 @@ class RegisterForm(FlaskForm):
             if len(email) > 120:
                 raise ValidationError('Email address is too long')
             # Additional email format validation
-            pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-            if not re.match(pattern, email):
+            if not EMAIL_RE.match(email):
                 raise ValidationError('Please enter a valid email address')
 
 class LoginForm(FlaskForm):
@@ -51,7 +56,7 @@ class BookingForm(FlaskForm):
     passenger_name = StringField('Passenger Name', validators=[
         DataRequired(message='Passenger name is required'),
         Length(min=2, max=120, message='Name must be between 2 and 120 characters'),
-        Regexp(r'^[a-zA-Z\s]+$', message='Name can only contain letters and spaces')
+        Regexp(NAME_RE, message='Name can only contain letters and spaces')
     ])
     passenger_age = IntegerField('Age', validators=[
         DataRequired(message='Age is required'),
@@ -81,21 +86,21 @@ class PaymentForm(FlaskForm):
     card_name = StringField('Name on Card', validators=[
         DataRequired(message='Cardholder name is required'),
         Length(min=2, max=100, message='Name must be between 2 and 100 characters'),
-        Regexp(r'^[a-zA-Z\s]+$', message='Name can only contain letters and spaces')
+        Regexp(NAME_RE, message='Name can only contain letters and spaces')
     ])
     card_number = StringField('Card Number', validators=[
         DataRequired(message='Card number is required'),
         Length(min=13, max=19, message='Card number must be between 13 and 19 digits'),
-        Regexp(r'^\d+$', message='Card number must contain only digits')
+        Regexp(DIGITS_RE, message='Card number must contain only digits')
     ])
     expiry = StringField('Expiry (MM/YY)', validators=[
         DataRequired(message='Expiry date is required'),
-        Regexp(r'^(0[1-9]|1[0-2])\/\d{2}$', message='Please enter expiry in MM/YY format')
+        Regexp(EXPIRY_RE, message='Please enter expiry in MM/YY format')
     ])
     cvv = StringField('CVV', validators=[
         DataRequired(message='CVV is required'),
         Length(min=3, max=4, message='CVV must be 3 or 4 digits'),
-        Regexp(r'^\d+$', message='CVV must contain only digits')
+        Regexp(DIGITS_RE, message='CVV must contain only digits')
     ])
     submit = SubmitField('Pay Now')
 
@@ -103,7 +108,7 @@ class ProfileForm(FlaskForm):
     name = StringField('Full Name', validators=[
         DataRequired(message='Name is required'),
         Length(min=2, max=120, message='Name must be between 2 and 120 characters'),
-        Regexp(r'^[a-zA-Z\s]+$', message='Name can only contain letters and spaces')
+        Regexp(NAME_RE, message='Name can only contain letters and spaces')
     ])
     profile_pic = FileField('Profile Picture', validators=[
         FileAllowed(['jpg', 'jpeg', 'png', 'gif'], message='Only image files (JPG, PNG, GIF) are allowed'),
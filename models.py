@@ -1,16 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import func
+from sqlalchemy.orm import column_property, validates
 
 db = SQLAlchemy()
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120))
-    email = db.Column(db.String(120), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(200), nullable=False)
     profile_pic = db.Column(db.String(200))
     bookings = db.relationship('Booking', backref='user', lazy=True)
 
+    @validates('email')
+    def normalize_email(self, key, email):
+        # Stored lower-cased so lookups can use a plain equality match on the index
+        return email.strip().lower() if email else email
+
 class Train(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
@@ -21,8 +28,19 @@ class Train(db.Model):
     arrive = db.Column(db.String(20))
     duration = db.Column(db.String(30))
     fare = db.Column(db.Float)
+    # Selector label built by the database, so listings don't format it in Python
+    display_label = column_property(
+        name + ' • ' + number + ' • ' + func.coalesce(from_station, '') + ' → '
+        + func.coalesce(to_station, '') + ' • ' + func.coalesce(depart, ''),
+        deferred=True
+    )
 
 class Booking(db.Model):
+    __table_args__ = (
+        db.Index('ix_booking_user_date', 'user_id', 'travel_date'),
+        db.Index('ix_booking_train_date', 'train_id', 'travel_date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     train_id = db.Column(db.Integer, db.ForeignKey('train.id'), nullable=False)